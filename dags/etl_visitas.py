@@ -5,19 +5,17 @@ from datetime import datetime, timedelta
 from airflow import DAG
 from airflow.decorators import task
 from airflow.utils.dates import days_ago
-import yaml
 
 # Add modules to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from modules.transformation import DataTransformer
-from modules.loading import MySQLLoader
-from modules.metrics import ETLMetrics
+# Only lightweight imports at module level: the scheduler re-parses this file
+# every few seconds. pandas, pydantic, great_expectations and mysql.connector
+# are imported inside the tasks that need them.
+from modules.config import load_config
 
-# Load config
-config_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config.yaml')
-with open(config_path, 'r') as f:
-    config = yaml.safe_load(f)
+# Load config (cached per file modification time)
+config = load_config()
 
 default_args = {
     'owner': 'etl_team',
@@ -29,11 +27,23 @@ default_args = {
     'retry_delay': timedelta(minutes=5),
 }
 
+def configure_run_profiling(metrics):
+    """Enable opt-in stage profiling for this task, grouped by run"""
+    from modules.profiling import configure_profiling
+
+    run_id = datetime.fromtimestamp(metrics.metrics['execution_start']).strftime('%Y%m%dT%H%M%S')
+    profiler = configure_profiling(run_id=run_id, config=config)
+    if profiler:
+        metrics.record_profile_dir(profiler.output_dir)
+
 @task
-def extract_task(metrics: ETLMetrics):
+def extract_task():
     """Extract data from local files (for development)"""
-    import os
     from pathlib import Path
+    from modules.metrics import ETLMetrics
+
+    metrics = ETLMetrics()
+    metrics.start_execution()
 
     start_time = time.time()
     local_dir = Path(__file__).parent.parent / 'data' / 'raw'
@@ -42,34 +52,50 @@ def extract_task(metrics: ETLMetrics):
     metrics.record_files_received(len(files))
     metrics.record_stage_time('extraction', start_time)
 
-    return files
+    return {'files': files, 'metrics': metrics.to_dict()}
 
 @task
-def transform_task(files, metrics: ETLMetrics):
+def transform_task(extracted):
     """Transform extracted files"""
+    from modules.metrics import ETLMetrics
+    from modules.transformation import DataTransformer
+
+    metrics = ETLMetrics.from_dict(extracted['metrics'])
+    files = extracted['files']
+    configure_run_profiling(metrics)
+
     start_time = time.time()
     transformer = DataTransformer()
     all_valid = []
     all_errors = []
 
     total_records = 0
+    total_errors = 0
     for file in files:
         result = transformer.transform_file(file)
+        # errors are aggregated per error code; 'count' is the number of failing rows
+        error_count = sum(error['count'] for error in result['errors'])
         all_valid.extend(result['valid'])
         all_errors.extend(result['errors'])
-        total_records += len(result['valid']) + len(result['errors'])
+        total_records += len(result['valid']) + error_count
+        total_errors += error_count
 
     metrics.record_files_processed(len(files))
     metrics.record_records_received(total_records)
     metrics.record_records_valid(len(all_valid))
-    metrics.record_records_errors(len(all_errors))
+    metrics.record_records_errors(total_errors)
     metrics.record_stage_time('transformation', start_time)
 
-    return {'valid': all_valid, 'errors': all_errors}
+    return {'valid': all_valid, 'errors': all_errors, 'metrics': metrics.to_dict()}
 
 @task
-def load_task(data, files, metrics: ETLMetrics):
+def load_task(data, extracted):
     """Load data to MySQL"""
+    from modules.loading import MySQLLoader
+    from modules.metrics import ETLMetrics
+
+    metrics = ETLMetrics.from_dict(data['metrics'])
+    configure_run_profiling(metrics)
     start_time = time.time()
 
     # For containerized environment
@@ -79,27 +105,23 @@ def load_task(data, files, metrics: ETLMetrics):
         password='etl_pass',
         database='visitas_db'
     )
-    loader.load_data(data['valid'], data['errors'], files)
+    loader.load_data(data['valid'], data['errors'], extracted['files'])
 
     metrics.record_stage_time('loading', start_time)
     metrics.end_execution()
     metrics.log_summary()
 
 with DAG(
-    'etl_visitas_diario',
+    config.get('airflow', {}).get('dag_id', 'etl_visitas_diario'),
     default_args=default_args,
     description='ETL diario para datos de visitas web',
-    schedule_interval='@daily',
+    schedule_interval=config.get('airflow', {}).get('schedule', '@daily'),
     catchup=False,
     max_active_runs=1,
 ) as dag:
 
-    # Initialize metrics
-    metrics = ETLMetrics()
-    metrics.start_execution()
-
-    extracted_files = extract_task(metrics)
-    transformed_data = transform_task(extracted_files, metrics)
-    load_task(transformed_data, extracted_files, metrics)
-
-    # Note: end_execution is called in load_task after logging summary
\ No newline at end of file
+    # Metrics are created inside extract_task and handed along via XCom, so
+    # nothing is instantiated while the scheduler parses this file.
+    extracted = extract_task()
+    transformed_data = transform_task(extracted)
+    load_task(transformed_data, extracted)
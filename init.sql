@@ -10,13 +10,17 @@ CREATE TABLE IF NOT EXISTS visitante (
     visitasMesActual INT DEFAULT 0
 );
 
+-- Range-partitioned by month on fecha_envio. p_old catches anything before the
+-- first monthly partition and pmax is kept empty: MySQLLoader.ensure_partitions
+-- splits new months off pmax ahead of time, and old months are archived and
+-- dropped with `python -m modules.maintenance archive-partitions`.
 CREATE TABLE IF NOT EXISTS estadistica (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     email VARCHAR(255),
     jyv VARCHAR(255),
     badmail VARCHAR(50),
     baja VARCHAR(50),
-    fecha_envio DATETIME,
+    fecha_envio DATETIME NOT NULL,
     fecha_open DATETIME,
     opens INT DEFAULT 0,
     opens_virales INT DEFAULT 0,
@@ -26,13 +30,72 @@ CREATE TABLE IF NOT EXISTS estadistica (
     links TEXT,
     ips VARCHAR(255),
     navegadores TEXT,
-    plataformas VARCHAR(255)
+    plataformas VARCHAR(255),
+    origen VARCHAR(255),
+    PRIMARY KEY (id, fecha_envio),
+    KEY idx_estadistica_email (email),
+    KEY idx_estadistica_fecha_envio (fecha_envio),
+    KEY idx_estadistica_origen (origen)
+)
+PARTITION BY RANGE (TO_DAYS(fecha_envio)) (
+    PARTITION p_old VALUES LESS THAN (TO_DAYS('2013-01-01')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Daily campaign rollup maintained by MySQLLoader on every estadistica batch
+-- (and decremented when a source is reloaded). Rates are derived by dividing
+-- by envios. Rebuild with `python -m modules.maintenance rebuild-rollup`.
+CREATE TABLE IF NOT EXISTS estadistica_diaria (
+    fecha DATE NOT NULL,
+    plataformas VARCHAR(255) NOT NULL DEFAULT '',
+    navegadores VARCHAR(255) NOT NULL DEFAULT '',
+    envios INT DEFAULT 0,
+    opens INT DEFAULT 0,
+    opens_virales INT DEFAULT 0,
+    clicks INT DEFAULT 0,
+    clicks_virales INT DEFAULT 0,
+    con_open INT DEFAULT 0,
+    con_click INT DEFAULT 0,
+    badmails INT DEFAULT 0,
+    bajas INT DEFAULT 0,
+    PRIMARY KEY (fecha, plataformas, navegadores)
 );
 
+-- One row per (source report, error code) per load: repeated failures are
+-- aggregated in DataTransformer into a count plus a few sampled rows stored as
+-- compact JSON ([{"line": n, "data": {...}}, ...]).
 CREATE TABLE IF NOT EXISTS errores (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    row_index INT,
-    data TEXT,
+    origen VARCHAR(255),
+    error_code VARCHAR(100),
     error_message TEXT,
-    processed_at DATETIME DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+    ocurrencias INT DEFAULT 1,
+    primera_linea INT,
+    muestras JSON,
+    processed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_errores_origen (origen),
+    KEY idx_errores_code (error_code)
+);
+
+-- One row per loaded source report, so reloads (e.g. backfills from the
+-- visitas_backup_*.zip archives) can skip or replace what is already there.
+CREATE TABLE IF NOT EXISTS cargas (
+    origen VARCHAR(255) PRIMARY KEY,
+    sha256 CHAR(64),
+    registros INT DEFAULT 0,
+    errores INT DEFAULT 0,
+    cargado_en DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Migrations in modules/migrations.py bring existing databases to this
+-- schema; a fresh database already has it.
+CREATE TABLE IF NOT EXISTS schema_migraciones (
+    id VARCHAR(100) PRIMARY KEY,
+    aplicada_en DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO schema_migraciones (id) VALUES
+    ('001_particiones_estadistica'),
+    ('002_origen_cargas'),
+    ('003_errores_agregados'),
+    ('004_estadistica_diaria');
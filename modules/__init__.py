@@ -0,0 +1,28 @@
+"""ETL modules.
+
+Submodules pull in heavy dependencies (pandas, pydantic, great_expectations,
+mysql.connector, paramiko), so the public classes are resolved lazily on
+first attribute access. Importing the package itself stays cheap, which
+keeps Airflow DAG parsing fast.
+"""
+import importlib
+
+_LAZY_ATTRS = {
+    'SFTPExtractor': 'modules.extraction',
+    'DataTransformer': 'modules.transformation',
+    'MySQLLoader': 'modules.loading',
+    'ETLMetrics': 'modules.metrics',
+    'load_config': 'modules.config',
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,179 @@
+"""Replay visitas_backup_YYYYMMDD.zip archives through the transform/load path.
+
+Report members are read straight from the archives (no extraction to disk)
+and days are processed in parallel worker processes. Loads are paced with a
+cross-process semaphore limiting concurrent MySQL writers plus an optional
+pause between reports. Each report is loaded in one transaction that also
+records it in `cargas` (MySQLLoader.load_source), so a worker dying part-way
+leaves nothing behind, and re-running a range skips reports already loaded
+with the same content; `--replace` reloads them after a rule change.
+visitante is written with a single upsert per email (LEAST/GREATEST on the
+visit dates), so concurrent loads don't race and days can load out of order.
+A load that still hits a deadlock or lock wait timeout is rolled back and
+retried a few times before the archive is reported as failed.
+
+Usage:
+    python -m modules.backfill --start 2024-01-01 --end 2024-12-31 --workers 4 --max-concurrent-loads 2
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, date
+from multiprocessing import Semaphore
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.config import load_config
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATTERN = re.compile(r'^visitas_backup_(\d{8})\.zip$')
+
+# MySQL ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK: the transaction was rolled back and can be retried
+RETRYABLE_ERRNOS = (1205, 1213)
+LOAD_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 1.0
+
+_load_slots = None
+
+def _init_worker(load_slots, log_level):
+    global _load_slots
+    _load_slots = load_slots
+    logging.basicConfig(level=log_level)
+
+def find_archives(backup_dir: str, start: date, end: date) -> List[Tuple[date, str]]:
+    """Backup archives whose date falls in [start, end], oldest first"""
+    archives = []
+    for path in Path(backup_dir).glob('visitas_backup_*.zip'):
+        match = ARCHIVE_PATTERN.match(path.name)
+        if not match:
+            continue
+        archive_date = datetime.strptime(match.group(1), '%Y%m%d').date()
+        if start <= archive_date <= end:
+            archives.append((archive_date, str(path)))
+    return sorted(archives)
+
+def load_with_retry(loader, source: str, *args, attempts: int = LOAD_ATTEMPTS,
+                    delay: float = RETRY_DELAY_SECONDS, **kwargs):
+    """MySQLLoader.load_source, retried on deadlocks and lock wait timeouts"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return loader.load_source(source, *args, **kwargs)
+        except Exception as e:
+            if getattr(e, 'errno', None) not in RETRYABLE_ERRNOS or attempt == attempts:
+                raise
+            logger.warning(f"Retrying {source} after MySQL error {e.errno} (attempt {attempt}/{attempts})")
+            time.sleep(delay * attempt)
+
+def backfill_archive(archive_path: str, db: Dict[str, Any], replace: bool = False, pause: float = 0.0) -> Dict[str, Any]:
+    """Transform and load every report in one archive. Runs in a worker process."""
+    from modules.loading import MySQLLoader, file_sha256
+    from modules.transformation import DataTransformer
+
+    summary = {'archive': archive_path, 'reports': 0, 'skipped': 0, 'valid': 0, 'errors': 0}
+    loader = MySQLLoader(**db)
+    try:
+        loader.connect()
+        with zipfile.ZipFile(archive_path) as zipf:
+            for member in zipf.infolist():
+                if member.is_dir() or not member.filename.endswith('.txt'):
+                    continue
+                source = os.path.basename(member.filename)
+                with zipf.open(member) as f:
+                    sha256 = file_sha256(f)
+
+                loaded_hash = loader.get_loaded_hash(source)
+                if loaded_hash == sha256 and not replace:
+                    summary['skipped'] += 1
+                    continue
+
+                with zipf.open(member) as f:
+                    result = DataTransformer().transform_file(f, source=source)
+
+                if _load_slots is not None:
+                    _load_slots.acquire()
+                try:
+                    load_with_retry(loader, source, sha256, result['valid'], result['errors'],
+                                    replace=loaded_hash is not None)
+                finally:
+                    if _load_slots is not None:
+                        _load_slots.release()
+
+                summary['reports'] += 1
+                summary['valid'] += len(result['valid'])
+                summary['errors'] += sum(error['count'] for error in result['errors'])
+                if pause:
+                    time.sleep(pause)
+    finally:
+        loader.disconnect()
+
+    logger.info(f"Backfilled {archive_path}: {summary}")
+    return summary
+
+def run_backfill(start: date, end: date, backup_dir: str, db: Dict[str, Any], workers: int = 4,
+                 max_concurrent_loads: int = 2, pause: float = 0.0, replace: bool = False) -> List[Dict[str, Any]]:
+    """Backfill all archives in the date range across `workers` processes"""
+    archives = find_archives(backup_dir, start, end)
+    logger.info(f"Backfilling {len(archives)} archives from {start} to {end} with {workers} workers")
+
+    results = []
+    load_slots = Semaphore(max_concurrent_loads)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(load_slots, logging.getLogger().level)) as executor:
+        futures = {
+            executor.submit(backfill_archive, path, db, replace, pause): archive_date
+            for archive_date, path in archives
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Backfill failed for {futures[future]}: {e}")
+                results.append({'archive': futures[future], 'error': str(e)})
+
+    failed = sum(1 for result in results if 'error' in result)
+    logger.info(f"Backfill completed: {len(results) - failed} archives loaded, {failed} failed")
+    return results
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Reprocesar archivos de respaldo visitas_backup_*.zip')
+    parser.add_argument('--config', default=None, help='Ruta al config.yaml')
+    parser.add_argument('--start', required=True, help='Fecha inicial YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='Fecha final YYYY-MM-DD (inclusive)')
+    parser.add_argument('--backup-dir', default='./backups')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-concurrent-loads', type=int, default=2,
+                        help='Procesos que pueden escribir en MySQL a la vez')
+    parser.add_argument('--pause', type=float, default=0.0, help='Segundos de espera entre reportes')
+    parser.add_argument('--replace', action='store_true',
+                        help='Recargar reportes ya cargados (p. ej. tras cambiar reglas)')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    logging.basicConfig(level=config.get('logging', {}).get('level', 'INFO'),
+                        format=config.get('logging', {}).get('format'))
+
+    results = run_backfill(
+        start=datetime.strptime(args.start, '%Y-%m-%d').date(),
+        end=datetime.strptime(args.end, '%Y-%m-%d').date(),
+        backup_dir=args.backup_dir,
+        db=config['database'],
+        workers=args.workers,
+        max_concurrent_loads=args.max_concurrent_loads,
+        pause=args.pause,
+        replace=args.replace,
+    )
+    if any('error' in result for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
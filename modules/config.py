@@ -0,0 +1,22 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config.yaml')
+
+@lru_cache(maxsize=None)
+def _load_config_cached(path: str, mtime: float) -> Dict[str, Any]:
+    import yaml
+
+    with open(path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+    logger.info(f"Loaded config from {path}")
+    return config
+
+def load_config(path: str = None) -> Dict[str, Any]:
+    """Load YAML config, cached per path and modification time"""
+    path = os.path.abspath(path or DEFAULT_CONFIG_PATH)
+    return _load_config_cached(path, os.path.getmtime(path))
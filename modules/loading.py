@@ -1,23 +1,130 @@
-import mysql.connector
 import logging
 import zipfile
 import os
+import csv
+import gzip
+import hashlib
+import json
 import shutil
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
 from pathlib import Path
+from modules.profiling import profiled
 
 logger = logging.getLogger(__name__)
 
+ESTADISTICA_COLUMNS = [
+    'email', 'jyv', 'badmail', 'baja', 'fecha_envio', 'fecha_open', 'opens', 'opens_virales',
+    'fecha_click', 'clicks', 'clicks_virales', 'links', 'ips', 'navegadores', 'plataformas', 'origen'
+]
+
+# estadistica_diaria: one row per send date, platform and browser
+ROLLUP_KEYS = ['fecha', 'plataformas', 'navegadores']
+ROLLUP_MEASURES = [
+    'envios', 'opens', 'opens_virales', 'clicks', 'clicks_virales',
+    'con_open', 'con_click', 'badmails', 'bajas'
+]
+
+def _rollup_select(sign: str = '') -> str:
+    """SQL select list computing rollup rows from estadistica (mirrors aggregate_daily)"""
+    return f"""
+        DATE(fecha_envio), COALESCE(LEFT(plataformas, 255), ''), COALESCE(LEFT(navegadores, 255), ''),
+        {sign}COUNT(*), {sign}SUM(opens), {sign}SUM(opens_virales), {sign}SUM(clicks), {sign}SUM(clicks_virales),
+        {sign}SUM(opens > 0), {sign}SUM(clicks > 0),
+        {sign}SUM(COALESCE(badmail, '') <> ''), {sign}SUM(COALESCE(baja, '') <> '')
+    """
+
+_ROLLUP_UPSERT = f"""
+    INSERT INTO estadistica_diaria ({', '.join(ROLLUP_KEYS + ROLLUP_MEASURES)})
+    {{source}}
+    ON DUPLICATE KEY UPDATE {', '.join(f'{m} = {m} + VALUES({m})' for m in ROLLUP_MEASURES)}
+"""
+_ROLLUP_VALUES = f"VALUES ({', '.join(['%s'] * (len(ROLLUP_KEYS) + len(ROLLUP_MEASURES)))})"
+
+def aggregate_daily(records: List[Dict[str, Any]]) -> List[tuple]:
+    """Pre-aggregate estadistica records into estadistica_diaria rows (keys + measures),
+    sorted by key so concurrent upserts lock rollup rows in the same order"""
+    import pandas as pd
+
+    if not records:
+        return []
+    df = pd.DataFrame(records, columns=[
+        'email', 'fecha_envio', 'plataformas', 'navegadores', 'opens', 'opens_virales',
+        'clicks', 'clicks_virales', 'badmail', 'baja'
+    ])
+    df['fecha'] = pd.to_datetime(df['fecha_envio']).dt.date
+    for key in ('plataformas', 'navegadores'):
+        df[key] = df[key].fillna('').astype(str).str.slice(0, 255)
+    df['con_open'] = df['opens'] > 0
+    df['con_click'] = df['clicks'] > 0
+    df['badmails'] = df['badmail'].fillna('') != ''
+    df['bajas'] = df['baja'].fillna('') != ''
+
+    grouped = df.groupby(ROLLUP_KEYS, sort=True).agg(
+        envios=('email', 'size'),
+        **{m: (m, 'sum') for m in ROLLUP_MEASURES if m != 'envios'}
+    ).reset_index()
+    # Native Python types for the MySQL driver
+    return [
+        (row[0], row[1], row[2]) + tuple(int(v) for v in row[3:])
+        for row in grouped[ROLLUP_KEYS + ROLLUP_MEASURES].itertuples(index=False, name=None)
+    ]
+
+def file_sha256(file_obj_or_path) -> str:
+    """SHA256 of a file path or an open binary file (e.g. a zip member)"""
+    if isinstance(file_obj_or_path, str):
+        with open(file_obj_or_path, 'rb') as f:
+            return file_sha256(f)
+    hash_sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file_obj_or_path.read(65536), b""):
+        hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+def _to_days(value) -> int:
+    """Python equivalent of MySQL TO_DAYS()"""
+    return date(value.year, value.month, value.day).toordinal() + 365
+
+def _from_days(days: int) -> date:
+    return date.fromordinal(days - 365)
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def _next_month(value) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def partitions_end(months_ahead: int) -> date:
+    """Exclusive end of the monthly partitions created automatically: the current
+    month plus `months_ahead`. Later dates stay in pmax, so a bogus vendor date
+    (e.g. 9999-12-31) can't add thousands of partitions."""
+    target_end = _month_start(datetime.now())
+    for _ in range(months_ahead + 1):
+        target_end = _next_month(target_end)
+    return target_end
+
+def monthly_partitions(start: date, end: date) -> List[str]:
+    """PARTITION clauses pYYYYMM for each month from `start` up to (excluding) `end`"""
+    clauses = []
+    month = _month_start(start)
+    while month < end:
+        upper = _next_month(month)
+        clauses.append(f"PARTITION p{month.strftime('%Y%m')} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))")
+        month = upper
+    return clauses
+
 class MySQLLoader:
-    def __init__(self, host: str, user: str, password: str, database: str):
+    def __init__(self, host: str, user: str, password: str, database: str, partition_months_ahead: int = 2):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        self.partition_months_ahead = partition_months_ahead
         self.connection = None
+        self._warned_unpartitioned = False
 
     def connect(self):
+        import mysql.connector
+
         self.connection = mysql.connector.connect(
             host=self.host,
             user=self.user,
@@ -42,68 +149,322 @@ class MySQLLoader:
         finally:
             cursor.close()
 
-    def load_visitante(self, records: List[Dict[str, Any]]):
-        """Load into visitante table - incremental update"""
+    @profiled('loading.load_visitante')
+    def load_visitante(self, records: List[Dict[str, Any]], cursor=None):
+        """Load into visitante table - incremental upsert.
+
+        Visits are pre-aggregated per email and written with one
+        INSERT ... ON DUPLICATE KEY UPDATE per email, keeping the earliest and
+        latest visit with LEAST/GREATEST. There is no select-then-insert, so
+        concurrent loads (parallel backfill) can't race on new emails, and days
+        may be loaded in any order. Emails are written in sorted order so
+        concurrent transactions lock rows in the same order. Every record counts
+        as a visit: reloads of a source are kept out by cargas (see load_source).
+        Runs in the caller's transaction when given its cursor.
+        """
+        visits = {}
         for record in records:
-            email = record['email']
-            fecha_envio = record['fecha_envio']
+            email, fecha_envio = record['email'], record['fecha_envio']
+            first, last, count = visits.get(email, (fecha_envio, fecha_envio, 0))
+            visits[email] = (min(first, fecha_envio), max(last, fecha_envio), count + 1)
+        if not visits:
+            return
 
-            # Check if email exists
+        own_cursor = cursor is None
+        if own_cursor:
             cursor = self.connection.cursor()
-            cursor.execute("SELECT fechaUltimaVisita, visitasTotales FROM visitante WHERE email = %s", (email,))
-            result = cursor.fetchone()
-
-            if result:
-                # Update existing
-                fecha_ultima, visitas_totales = result
-                if fecha_envio > fecha_ultima:
-                    nueva_fecha_primera = result[0]  # keep original
-                    nueva_fecha_ultima = fecha_envio
-                    nuevas_visitas_totales = visitas_totales + 1
-                    # Calculate visitasAnioActual, visitasMesActual - simplified
-                    cursor.execute("""
-                        UPDATE visitante
-                        SET fechaUltimaVisita = %s, visitasTotales = %s
-                        WHERE email = %s
-                    """, (nueva_fecha_ultima, nuevas_visitas_totales, email))
-            else:
-                # Insert new
-                cursor.execute("""
-                    INSERT INTO visitante (email, fechaPrimeraVisita, fechaUltimaVisita, visitasTotales, visitasAnioActual, visitasMesActual)
-                    VALUES (%s, %s, %s, 1, 1, 1)
-                """, (email, fecha_envio, fecha_envio))
+        # visitasAnioActual, visitasMesActual - simplified, only set on insert
+        cursor.executemany("""
+            INSERT INTO visitante (email, fechaPrimeraVisita, fechaUltimaVisita, visitasTotales, visitasAnioActual, visitasMesActual)
+            VALUES (%s, %s, %s, %s, 1, 1)
+            ON DUPLICATE KEY UPDATE
+                fechaPrimeraVisita = LEAST(COALESCE(fechaPrimeraVisita, VALUES(fechaPrimeraVisita)), VALUES(fechaPrimeraVisita)),
+                fechaUltimaVisita = GREATEST(COALESCE(fechaUltimaVisita, VALUES(fechaUltimaVisita)), VALUES(fechaUltimaVisita)),
+                visitasTotales = visitasTotales + VALUES(visitasTotales)
+        """, [(email, first, last, count) for email, (first, last, count) in sorted(visits.items())])
+        if own_cursor:
+            self.connection.commit()
             cursor.close()
+        logger.info(f"Upserted {len(visits)} visitante rows from {len(records)} records")
 
-    def load_estadistica(self, records: List[Dict[str, Any]]):
-        """Load into estadistica table - append"""
+    def get_partitions(self, table: str = 'estadistica') -> List[Tuple[str, Optional[int]]]:
+        """Return (partition name, TO_DAYS upper bound or None for MAXVALUE) in range order"""
         cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM INFORMATION_SCHEMA.PARTITIONS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (self.database, table))
+        rows = cursor.fetchall()
+        cursor.close()
+        # Unpartitioned tables report a single row with a NULL partition name
+        return [(name, None if desc == 'MAXVALUE' else int(desc)) for name, desc in rows if name]
+
+    def ensure_partitions(self, dates: List[Any] = (), months_ahead: int = None) -> List[Tuple[str, Optional[int]]]:
+        """Split monthly partitions off pmax up to `months_ahead` months past the
+        current one (see partitions_end); `dates` beyond that are only logged.
+        Serialized with a named lock, since parallel backfill workers may race here."""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT GET_LOCK('estadistica_partitions', 60)")
+        cursor.fetchone()
+        try:
+            return self._ensure_partitions(dates, self.partition_months_ahead if months_ahead is None else months_ahead)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('estadistica_partitions')")
+            cursor.fetchone()
+            cursor.close()
+
+    def _ensure_partitions(self, dates: List[Any], months_ahead: int) -> List[Tuple[str, Optional[int]]]:
+        partitions = self.get_partitions()
+        bounds = [bound for _, bound in partitions if bound is not None]
+        if not bounds or partitions[-1][1] is not None:
+            # Not partitioned (or no MAXVALUE catch-all to split): plain inserts
+            if not self._warned_unpartitioned:
+                logger.warning("estadistica is not partitioned by month; loading with plain inserts. "
+                               "Run `python -m modules.maintenance migrate` to convert it")
+                self._warned_unpartitioned = True
+            return partitions
+
+        target_end = partitions_end(months_ahead)
+        beyond = sum(1 for value in dates if _to_days(value) >= _to_days(target_end))
+        if beyond:
+            logger.warning(f"{beyond} records dated on or after {target_end} go to {partitions[-1][0]}")
+
+        # Monthly partitions are kept contiguous from the last bound up to pmax
+        new_partitions = monthly_partitions(_from_days(max(bounds)), target_end)
+
+        if new_partitions:
+            maxvalue_name = partitions[-1][0]
+            self.execute_query(
+                f"ALTER TABLE estadistica REORGANIZE PARTITION {maxvalue_name} INTO ("
+                + ", ".join(new_partitions + [f"PARTITION {maxvalue_name} VALUES LESS THAN MAXVALUE"])
+                + ")"
+            )
+            logger.info(f"Created {len(new_partitions)} estadistica partitions up to {target_end}")
+            partitions = self.get_partitions()
+        return partitions
+
+    @staticmethod
+    def partition_for(value, partitions: List[Tuple[str, Optional[int]]]) -> Optional[str]:
+        """Name of the range partition holding `value`, or None when unpartitioned"""
+        days = _to_days(value)
+        for name, bound in partitions:
+            if bound is None or days < bound:
+                return name
+        return None
+
+    @profiled('loading.load_estadistica')
+    def load_estadistica(self, records: List[Dict[str, Any]], cursor=None):
+        """Load into estadistica table - append, one batch per monthly partition.
+        Runs in the caller's transaction when given its cursor; the caller must
+        then have called ensure_partitions beforehand (DDL commits implicitly)."""
+        own_cursor = cursor is None
+        if own_cursor:
+            partitions = self.ensure_partitions([record['fecha_envio'] for record in records])
+            cursor = self.connection.cursor()
+        else:
+            partitions = self.get_partitions()
+
+        batches = {}
         for record in records:
-            cursor.execute("""
-                INSERT INTO estadistica (
-                    email, jyv, badmail, baja, fecha_envio, fecha_open, opens, opens_virales,
-                    fecha_click, clicks, clicks_virales, links, ips, navegadores, plataformas
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
+            partition = self.partition_for(record['fecha_envio'], partitions)
+            batches.setdefault(partition, []).append((
                 record['email'], record.get('jk'), record.get('badmail'), record.get('baja'),
                 record['fecha_envio'], record.get('fecha_open'), record['opens'], record['opens_virales'],
                 record.get('fecha_click'), record['clicks'], record['clicks_virales'],
-                record.get('links'), record.get('ips'), record.get('navegadores'), record.get('plataformas')
+                record.get('links'), record.get('ips'), record.get('navegadores'), record.get('plataformas'),
+                record.get('origen')
             ))
-        self.connection.commit()
-        cursor.close()
+
+        for partition, rows in batches.items():
+            target = f"estadistica PARTITION ({partition})" if partition else "estadistica"
+            cursor.executemany(f"""
+                INSERT INTO {target} (
+                    {', '.join(ESTADISTICA_COLUMNS)}
+                ) VALUES ({', '.join(['%s'] * len(ESTADISTICA_COLUMNS))})
+            """, rows)
+            logger.info(f"Loaded {len(rows)} records into {target}")
+        self.update_daily_rollup(records, cursor)
+        if own_cursor:
+            self.connection.commit()
+            cursor.close()
         logger.info(f"Loaded {len(records)} records into estadistica")
 
-    def load_errores(self, errors: List[Dict[str, Any]]):
-        """Load errors into errores table - append"""
+    def update_daily_rollup(self, records: List[Dict[str, Any]], cursor=None):
+        """Add a batch to estadistica_diaria: aggregated in pandas, one upsert row per group.
+        Runs in the caller's transaction when given its cursor."""
+        rows = aggregate_daily(records)
+        if not rows:
+            return
+        own_cursor = cursor is None
+        if own_cursor:
+            cursor = self.connection.cursor()
+        cursor.executemany(_ROLLUP_UPSERT.format(source=_ROLLUP_VALUES), rows)
+        if own_cursor:
+            self.connection.commit()
+            cursor.close()
+        logger.info(f"Updated {len(rows)} estadistica_diaria groups from {len(records)} records")
+
+    def rebuild_daily_rollup(self, start: date = None, end: date = None):
+        """Recompute estadistica_diaria from estadistica for [start, end] (all dates by default).
+        Days whose partitions were archived lose their rollup rows if included."""
+        conditions, params = [], []
+        if start:
+            conditions.append("{column} >= %s")
+            params.append(start)
+        if end:
+            conditions.append("{column} < %s")
+            params.append(end + timedelta(days=1))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
         cursor = self.connection.cursor()
-        for error in errors:
-            cursor.execute("""
-                INSERT INTO errores (row_index, data, error_message, processed_at)
-                VALUES (%s, %s, %s, %s)
-            """, (error['row'], str(error['data']), error['error'], datetime.now()))
-        self.connection.commit()
+        try:
+            cursor.execute(f"DELETE FROM estadistica_diaria {where.format(column='fecha')}", tuple(params))
+            cursor.execute(
+                _ROLLUP_UPSERT.format(source=f"SELECT {_rollup_select()} FROM estadistica "
+                                             f"{where.format(column='fecha_envio')} GROUP BY 1, 2, 3"),
+                tuple(params)
+            )
+            rebuilt = cursor.rowcount
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            raise e
+        finally:
+            cursor.close()
+        logger.info(f"Rebuilt estadistica_diaria ({rebuilt} rows affected) for {start or 'start'} to {end or 'end'}")
+
+    def archive_partitions(self, before: date, archive_dir: Optional[str] = './archives') -> List[str]:
+        """Drop estadistica partitions entirely older than `before`, exporting each
+        to a gzip-compressed CSV in `archive_dir` first (None drops without archiving)"""
+        cutoff = _to_days(before)
+        old_partitions = [
+            name for name, bound in self.get_partitions()
+            if bound is not None and bound <= cutoff
+        ]
+
+        if archive_dir:
+            Path(archive_dir).mkdir(parents=True, exist_ok=True)
+        for name in old_partitions:
+            if archive_dir:
+                archive_path = os.path.join(archive_dir, f'estadistica_{name}.csv.gz')
+                cursor = self.connection.cursor()
+                cursor.execute(f"SELECT id, {', '.join(ESTADISTICA_COLUMNS)} FROM estadistica PARTITION ({name})")
+                with gzip.open(archive_path, 'wt', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['id'] + ESTADISTICA_COLUMNS)
+                    rows = cursor.fetchmany(10000)
+                    while rows:
+                        writer.writerows(rows)
+                        rows = cursor.fetchmany(10000)
+                cursor.close()
+                logger.info(f"Archived partition {name} to {archive_path}")
+            self.execute_query(f"ALTER TABLE estadistica DROP PARTITION {name}")
+            logger.info(f"Dropped partition {name}")
+
+        return old_partitions
+
+    @profiled('loading.load_errores')
+    def load_errores(self, errors: List[Dict[str, Any]], cursor=None):
+        """Load aggregated errors into errores table - append, one row per error code and source.
+        Runs in the caller's transaction when given its cursor."""
+        if not errors:
+            return
+        processed_at = datetime.now()
+        own_cursor = cursor is None
+        if own_cursor:
+            cursor = self.connection.cursor()
+        cursor.executemany("""
+            INSERT INTO errores (origen, error_code, error_message, ocurrencias, primera_linea, muestras, processed_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(
+            error.get('origen'), error['code'], error['error'], error['count'], error.get('first_line'),
+            json.dumps(error['samples'], separators=(',', ':'), default=str), processed_at
+        ) for error in errors])
+        if own_cursor:
+            self.connection.commit()
+            cursor.close()
+        logger.info(f"Loaded {len(errors)} error groups ({sum(error['count'] for error in errors)} rows) into errores")
+
+    def get_loaded_hash(self, source: str) -> Optional[str]:
+        """sha256 recorded in cargas for a source report ('' if unknown), None if never loaded"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT sha256 FROM cargas WHERE origen = %s", (source,))
+        result = cursor.fetchone()
         cursor.close()
-        logger.info(f"Loaded {len(errors)} errors into errores")
+        return (result[0] or '') if result else None
+
+    def record_load(self, source: str, sha256: str, valid_count: int, error_count: int, cursor=None):
+        """Register a loaded source report in cargas.
+        Runs in the caller's transaction when given its cursor."""
+        if cursor is None:
+            execute = self.execute_query
+        else:
+            execute = cursor.execute
+        execute("""
+            INSERT INTO cargas (origen, sha256, registros, errores, cargado_en)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE sha256 = VALUES(sha256), registros = VALUES(registros),
+                errores = VALUES(errores), cargado_en = VALUES(cargado_en)
+        """, (source, sha256, valid_count, error_count, datetime.now()))
+
+    def delete_source(self, source: str, cursor=None):
+        """Remove estadistica and errores rows previously loaded from a source report.
+        Runs in the caller's transaction when given its cursor."""
+        own_cursor = cursor is None
+        if own_cursor:
+            cursor = self.connection.cursor()
+        # Subtract the rows from the rollup before removing them, in key order
+        # like update_daily_rollup, then drop only the groups that went empty
+        cursor.execute(f"SELECT {_rollup_select('-')} FROM estadistica WHERE origen = %s "
+                       f"GROUP BY 1, 2, 3 ORDER BY 1, 2, 3", (source,))
+        rows = cursor.fetchall()
+        if rows:
+            cursor.executemany(_ROLLUP_UPSERT.format(source=_ROLLUP_VALUES), rows)
+            cursor.executemany(f"""
+                DELETE FROM estadistica_diaria
+                WHERE {' AND '.join(f'{key} = %s' for key in ROLLUP_KEYS)} AND envios <= 0
+            """, [row[:len(ROLLUP_KEYS)] for row in rows])
+        cursor.execute("DELETE FROM estadistica WHERE origen = %s", (source,))
+        deleted = cursor.rowcount
+        cursor.execute("DELETE FROM errores WHERE origen = %s", (source,))
+        if own_cursor:
+            self.connection.commit()
+            cursor.close()
+        if deleted:
+            logger.info(f"Deleted {deleted} estadistica rows from {source}")
+
+    def load_source(self, source: str, sha256: str, valid_records: List[Dict[str, Any]],
+                    error_records: List[Dict[str, Any]], replace: bool = False):
+        """Load one source report atomically and idempotently.
+
+        Partitions are created first, since DDL commits implicitly in MySQL.
+        Then a single transaction inserts the new rows, updates the rollup and
+        records the load in cargas, so a failure part-way leaves nothing
+        behind. `replace` means cargas already has `source`: rows from the
+        earlier load are deleted first and visitante is left alone, since its
+        counters already include that load. New sources skip the delete, which
+        would find nothing but still take gap locks on the origen index that
+        block concurrent loads. Requires an open connection.
+        """
+        self.ensure_partitions([record['fecha_envio'] for record in valid_records])
+        cursor = self.connection.cursor()
+        try:
+            if replace:
+                self.delete_source(source, cursor)
+            else:
+                self.load_visitante(valid_records, cursor)
+            self.load_estadistica(valid_records, cursor)
+            self.load_errores(error_records, cursor)
+            self.record_load(source, sha256, len(valid_records),
+                             sum(error['count'] for error in error_records), cursor)
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            raise e
+        finally:
+            cursor.close()
 
     def backup_files(self, file_paths: List[str], backup_dir: str = './backups'):
         """Create zip backup of processed files and remove originals"""
@@ -118,8 +479,8 @@ class MySQLLoader:
         zip_filename = f'visitas_backup_{date_str}.zip'
         zip_path = os.path.join(backup_dir, zip_filename)
 
-        # Create zip file
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # Create zip file, appending if the day already has one
+        with zipfile.ZipFile(zip_path, 'a', zipfile.ZIP_DEFLATED) as zipf:
             for file_path in file_paths:
                 if os.path.exists(file_path):
                     # Add file to zip with relative path
@@ -135,9 +496,20 @@ class MySQLLoader:
         """Main loading method"""
         try:
             self.connect()
-            self.load_visitante(valid_records)
-            self.load_estadistica(valid_records)
-            self.load_errores(error_records)
+
+            # One atomic load per source report (see load_source)
+            valid_by_source, errors_by_source = {}, {}
+            for record in valid_records:
+                valid_by_source.setdefault(record.get('origen'), []).append(record)
+            for error in error_records:
+                errors_by_source.setdefault(error.get('origen'), []).append(error)
+            paths = {os.path.basename(file_path): file_path for file_path in file_paths or []}
+
+            for source in sorted(set(valid_by_source) | set(errors_by_source), key=str):
+                path = paths.get(source)
+                sha256 = file_sha256(path) if path and os.path.exists(path) else None
+                self.load_source(source, sha256, valid_by_source.get(source, []), errors_by_source.get(source, []),
+                                 replace=source is not None and self.get_loaded_hash(source) is not None)
 
             # Create backup after successful load
             if file_paths:
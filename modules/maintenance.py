@@ -0,0 +1,100 @@
+"""Maintenance commands for the visitas database.
+
+Usage:
+    python -m modules.maintenance migrate
+    python -m modules.maintenance ensure-partitions --months-ahead 3
+    python -m modules.maintenance archive-partitions --before 2024-01 --archive-dir ./archives
+    python -m modules.maintenance archive-partitions --before 2024-01 --no-archive
+    python -m modules.maintenance rebuild-rollup --start 2024-01-01 --end 2024-01-31
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.config import load_config
+
+logger = logging.getLogger(__name__)
+
+def get_loader(config_path: str = None):
+    """Build a MySQLLoader from the `database` section of the config"""
+    from modules.loading import MySQLLoader
+
+    db = load_config(config_path)['database']
+    return MySQLLoader(host=db['host'], user=db['user'], password=db['password'], database=db['database'])
+
+def migrate(args):
+    from modules.migrations import migrate as apply_migrations
+
+    loader = get_loader(args.config)
+    try:
+        loader.connect()
+        apply_migrations(loader)
+    finally:
+        loader.disconnect()
+
+def ensure_partitions(args):
+    loader = get_loader(args.config)
+    try:
+        loader.connect()
+        loader.ensure_partitions(months_ahead=args.months_ahead)
+    finally:
+        loader.disconnect()
+
+def archive_partitions(args):
+    before = datetime.strptime(args.before, '%Y-%m').date()
+    loader = get_loader(args.config)
+    try:
+        loader.connect()
+        dropped = loader.archive_partitions(before, None if args.no_archive else args.archive_dir)
+        logger.info(f"Removed {len(dropped)} partitions older than {before}: {dropped}")
+    finally:
+        loader.disconnect()
+
+def rebuild_rollup(args):
+    start = datetime.strptime(args.start, '%Y-%m-%d').date() if args.start else None
+    end = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else None
+    loader = get_loader(args.config)
+    try:
+        loader.connect()
+        loader.rebuild_daily_rollup(start, end)
+    finally:
+        loader.disconnect()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Mantenimiento de la base de datos de visitas')
+    parser.add_argument('--config', default=None, help='Ruta al config.yaml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('migrate', help='Aplicar migraciones pendientes a una base existente')
+    p.set_defaults(func=migrate)
+
+    p = subparsers.add_parser('ensure-partitions', help='Crear particiones mensuales por adelantado')
+    p.add_argument('--months-ahead', type=int, default=2)
+    p.set_defaults(func=ensure_partitions)
+
+    p = subparsers.add_parser('archive-partitions', help='Archivar y eliminar particiones antiguas')
+    p.add_argument('--before', required=True, help='Mes YYYY-MM; se eliminan particiones anteriores')
+    p.add_argument('--archive-dir', default='./archives')
+    p.add_argument('--no-archive', action='store_true', help='Eliminar sin exportar a .csv.gz')
+    p.set_defaults(func=archive_partitions)
+
+    p = subparsers.add_parser('rebuild-rollup', help='Recalcular estadistica_diaria desde estadistica')
+    p.add_argument('--start', default=None, help='Fecha inicial YYYY-MM-DD (por defecto todo)')
+    p.add_argument('--end', default=None, help='Fecha final YYYY-MM-DD, inclusive')
+    p.set_defaults(func=rebuild_rollup)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    logging.basicConfig(level=config.get('logging', {}).get('level', 'INFO'),
+                        format=config.get('logging', {}).get('format'))
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -19,9 +19,22 @@ class ETLMetrics:
             'records_errors': 0,
             'stage_times': {},
             'alerts_generated': 0,
-            'alerts_resolved': 0
+            'alerts_resolved': 0,
+            'profile_dir': None
         }
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable snapshot, used to hand metrics between Airflow tasks"""
+        return dict(self.metrics, stage_times=dict(self.metrics['stage_times']))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ETLMetrics':
+        """Rebuild metrics from a snapshot produced by to_dict"""
+        metrics = cls()
+        metrics.metrics.update(data or {})
+        metrics.metrics['stage_times'] = dict(metrics.metrics.get('stage_times') or {})
+        return metrics
+
     def start_execution(self):
         """Mark execution start"""
         self.metrics['execution_start'] = time.time()
@@ -66,6 +79,11 @@ class ETLMetrics:
         self.metrics['records_errors'] = count
         logger.info(f"Error records: {count}")
 
+    def record_profile_dir(self, path: str):
+        """Record where this run's stage profiles are written"""
+        self.metrics['profile_dir'] = path
+        logger.info(f"Stage profiles: {path}")
+
     def record_alert_generated(self):
         """Record alert generated"""
         self.metrics['alerts_generated'] += 1
@@ -85,6 +103,7 @@ class ETLMetrics:
             'execution_time_seconds': self.metrics.get('total_execution_time', 0),
             'stage_times': self.metrics['stage_times'],
             'alerts': f"{self.metrics['alerts_generated']} generated, {self.metrics['alerts_resolved']} resolved",
+            'profile_dir': self.metrics.get('profile_dir'),
             'timestamp': datetime.now().isoformat()
         }
 
@@ -98,4 +117,6 @@ class ETLMetrics:
         logger.info(f"Execution time: {summary['execution_time_seconds']:.2f}s")
         logger.info(f"Stage times: {summary['stage_times']}")
         logger.info(f"Alerts: {summary['alerts']}")
+        if summary['profile_dir']:
+            logger.info(f"Profiles: {summary['profile_dir']}")
         logger.info("==========================")
\ No newline at end of file
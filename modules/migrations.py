@@ -0,0 +1,141 @@
+"""Schema migrations for existing databases.
+
+docker-compose only runs init.sql when the mysql_data volume is empty, so
+schema changes made there never reach an existing database. Each migration
+below brings an existing database to the init.sql schema. Applied ids are
+recorded in `schema_migraciones`; init.sql marks them all as applied for
+fresh databases. Run with `python -m modules.maintenance migrate`.
+
+MySQL commits DDL implicitly, so a migration that fails part-way must be
+finished by hand before re-running.
+"""
+import logging
+from datetime import datetime
+from typing import List
+
+from modules.loading import MySQLLoader, monthly_partitions, partitions_end
+
+logger = logging.getLogger(__name__)
+
+def partition_estadistica(loader: MySQLLoader):
+    """Convert estadistica to monthly range partitions on fecha_envio"""
+    if loader.get_partitions():
+        logger.info("estadistica is already partitioned")
+        return
+
+    cursor = loader.connection.cursor()
+    cursor.execute("SELECT MIN(fecha_envio) FROM estadistica")
+    min_fecha = cursor.fetchone()[0]
+    cursor.close()
+
+    # The partitioning column must be part of every unique key, and the
+    # primary key requires NOT NULL (rows with NULL fecha_envio must be fixed first)
+    loader.execute_query("""
+        ALTER TABLE estadistica
+            MODIFY fecha_envio DATETIME NOT NULL,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, fecha_envio),
+            ADD KEY idx_estadistica_email (email),
+            ADD KEY idx_estadistica_fecha_envio (fecha_envio)
+    """)
+
+    first_month = min(min_fecha or datetime.now(), datetime.now())
+    first_month = datetime(first_month.year, first_month.month, 1).date()
+    # Up to the months kept ahead of time; later rows stay in pmax
+    partitions = monthly_partitions(first_month, partitions_end(loader.partition_months_ahead))
+    logger.info(f"Partitioning estadistica into {len(partitions)} monthly partitions from {first_month}")
+    loader.execute_query(
+        "ALTER TABLE estadistica PARTITION BY RANGE (TO_DAYS(fecha_envio)) ("
+        + ", ".join([f"PARTITION p_old VALUES LESS THAN (TO_DAYS('{first_month.isoformat()}'))"]
+                    + partitions
+                    + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+        + ")"
+    )
+
+# (id, steps): a step is an SQL statement or a callable taking the loader
+MIGRATIONS = [
+    ('001_particiones_estadistica', [partition_estadistica]),
+    ('002_origen_cargas', [
+        "ALTER TABLE estadistica ADD COLUMN origen VARCHAR(255), ADD KEY idx_estadistica_origen (origen)",
+        "ALTER TABLE errores ADD COLUMN origen VARCHAR(255), ADD KEY idx_errores_origen (origen)",
+        """
+        CREATE TABLE IF NOT EXISTS cargas (
+            origen VARCHAR(255) PRIMARY KEY,
+            sha256 CHAR(64),
+            registros INT DEFAULT 0,
+            errores INT DEFAULT 0,
+            cargado_en DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # The old errores rows (stringified row dicts) are kept in errores_legacy
+    ('003_errores_agregados', [
+        "RENAME TABLE errores TO errores_legacy",
+        """
+        CREATE TABLE errores (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            origen VARCHAR(255),
+            error_code VARCHAR(100),
+            error_message TEXT,
+            ocurrencias INT DEFAULT 1,
+            primera_linea INT,
+            muestras JSON,
+            processed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_errores_origen (origen),
+            KEY idx_errores_code (error_code)
+        )
+        """,
+    ]),
+    # Created empty, then filled once from the existing estadistica rows
+    ('004_estadistica_diaria', [
+        """
+        CREATE TABLE IF NOT EXISTS estadistica_diaria (
+            fecha DATE NOT NULL,
+            plataformas VARCHAR(255) NOT NULL DEFAULT '',
+            navegadores VARCHAR(255) NOT NULL DEFAULT '',
+            envios INT DEFAULT 0,
+            opens INT DEFAULT 0,
+            opens_virales INT DEFAULT 0,
+            clicks INT DEFAULT 0,
+            clicks_virales INT DEFAULT 0,
+            con_open INT DEFAULT 0,
+            con_click INT DEFAULT 0,
+            badmails INT DEFAULT 0,
+            bajas INT DEFAULT 0,
+            PRIMARY KEY (fecha, plataformas, navegadores)
+        )
+        """,
+        lambda loader: loader.rebuild_daily_rollup(),
+    ]),
+]
+
+def applied_migrations(loader: MySQLLoader) -> List[str]:
+    loader.execute_query("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            id VARCHAR(100) PRIMARY KEY,
+            aplicada_en DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor = loader.connection.cursor()
+    cursor.execute("SELECT id FROM schema_migraciones")
+    applied = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return applied
+
+def migrate(loader: MySQLLoader) -> List[str]:
+    """Apply pending migrations in order; returns the ids applied"""
+    applied = set(applied_migrations(loader))
+    newly_applied = []
+    for migration_id, steps in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        logger.info(f"Applying migration {migration_id}")
+        for step in steps:
+            if callable(step):
+                step(loader)
+            else:
+                loader.execute_query(step)
+        loader.execute_query("INSERT INTO schema_migraciones (id) VALUES (%s)", (migration_id,))
+        newly_applied.append(migration_id)
+    logger.info(f"Applied {len(newly_applied)} migrations: {newly_applied}")
+    return newly_applied
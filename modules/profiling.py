@@ -0,0 +1,211 @@
+"""Opt-in per-stage profiling.
+
+Enabled with the `profiling.mode` config key or the ETL_PROFILE environment
+variable (which wins):
+
+- ``cprofile``: deterministic cProfile, written as ``<stage>.pstats``
+  (load with ``pstats.Stats`` or snakeviz).
+- ``sampling``: a background thread samples the stage's stack every
+  ``sample_interval`` seconds, written as ``<stage>.collapsed`` (one
+  ``frame;frame;frame count`` line per stack, the input format of
+  flamegraph.pl and speedscope).
+
+Both modes also write ``<stage>.tracemalloc.txt`` with the top
+``tracemalloc_top`` allocating source lines; tracemalloc slows allocations
+down noticeably, so ``tracemalloc_top: 0`` turns it off (e.g. to keep sampling
+low-overhead). Files go to ``<output_dir>/<run_id>/``; the default run id
+includes the pid, so concurrent processes (backfill workers) don't overwrite
+each other. With profiling off the decorators add a single attribute lookup
+per call.
+"""
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV_VAR = 'ETL_PROFILE'
+PROFILE_DIR_ENV_VAR = 'ETL_PROFILE_DIR'
+PROFILE_MODES = ('cprofile', 'sampling')
+
+class _Sampler(threading.Thread):
+    """Collect collapsed stacks of one thread at a fixed interval"""
+
+    def __init__(self, thread_id: int, interval: float, counts: Counter):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = counts
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class StageProfiler:
+    """Profile named pipeline stages and write one set of files per stage"""
+
+    def __init__(self, mode: str, output_dir: str, sample_interval: float = 0.005, tracemalloc_top: int = 25):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.tracemalloc_top = tracemalloc_top
+        self._stats = {}
+        self._samples = {}
+        # Active cProfile profilers, innermost last. Only one can be enabled at
+        # a time, so an outer stage is paused while a nested one runs and the
+        # nested stats are folded back into it afterwards.
+        self._stack = []
+
+    @contextmanager
+    def profile(self, stage: str):
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        trace_memory = self.tracemalloc_top > 0
+        started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            if self._stack:
+                self._stack[-1][1].disable()
+            self._stack.append((stage, profiler))
+            profiler.enable()
+        else:
+            sampler = _Sampler(threading.get_ident(), self.sample_interval,
+                               self._samples.setdefault(stage, Counter()))
+            sampler.start()
+
+        try:
+            yield
+        finally:
+            if self.mode == 'cprofile':
+                profiler.disable()
+                self._stack.pop()
+                self._add_stats(stage, profiler)
+                for parent_stage, _ in self._stack:
+                    self._add_stats(parent_stage, profiler)
+                if self._stack:
+                    self._stack[-1][1].enable()
+                self._stats[stage].dump_stats(os.path.join(self.output_dir, f'{stage}.pstats'))
+            else:
+                sampler.stop()
+                self._write_collapsed(stage)
+
+            if trace_memory:
+                self._write_tracemalloc(stage, tracemalloc.take_snapshot())
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+    def _add_stats(self, stage: str, profiler: cProfile.Profile):
+        if stage in self._stats:
+            self._stats[stage].add(profiler)
+        else:
+            self._stats[stage] = pstats.Stats(profiler)
+
+    def _write_collapsed(self, stage: str):
+        path = os.path.join(self.output_dir, f'{stage}.collapsed')
+        with open(path, 'w') as f:
+            for stack, count in self._samples[stage].most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _write_tracemalloc(self, stage: str, snapshot: tracemalloc.Snapshot):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, threading.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        path = os.path.join(self.output_dir, f'{stage}.tracemalloc.txt')
+        with open(path, 'w') as f:
+            for stat in snapshot.statistics('lineno')[:self.tracemalloc_top]:
+                f.write(f"{stat}\n")
+
+_profiler = None
+_configured = False
+
+def configure_profiling(mode: str = None, output_dir: str = None, run_id: str = None,
+                        config: dict = None) -> 'StageProfiler':
+    """Set up (or disable) profiling for this process.
+
+    Settings come from `config['profiling']`, overridden by ETL_PROFILE and
+    ETL_PROFILE_DIR, overridden by explicit arguments. Returns the active
+    profiler, or None when profiling is off.
+    """
+    global _profiler, _configured
+
+    if config is None:
+        from modules.config import load_config
+        config = load_config()
+    settings = config.get('profiling') or {}
+
+    mode = mode or os.environ.get(PROFILE_ENV_VAR) or settings.get('mode') or ''
+    output_dir = output_dir or os.environ.get(PROFILE_DIR_ENV_VAR) or settings.get('output_dir', './profiles')
+    run_id = run_id or f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+    _configured = True
+    if not mode:
+        _profiler = None
+        return None
+
+    _profiler = StageProfiler(
+        mode,
+        os.path.join(output_dir, run_id),
+        sample_interval=settings.get('sample_interval', 0.005),
+        tracemalloc_top=settings.get('tracemalloc_top', 25),
+    )
+    logger.info(f"Profiling enabled ({mode}), writing to {_profiler.output_dir}")
+    return _profiler
+
+def get_profiler():
+    """Active profiler, configured from config/env on first use"""
+    if not _configured:
+        configure_profiling()
+    return _profiler
+
+@contextmanager
+def profile_stage(stage: str):
+    """Profile the enclosed block as `stage` when profiling is enabled"""
+    profiler = get_profiler()
+    if profiler is None:
+        yield
+        return
+    start_time = time.time()
+    with profiler.profile(stage):
+        yield
+    logger.debug(f"Profiled stage '{stage}' in {time.time() - start_time:.2f} seconds")
+
+def profiled(stage: str):
+    """Decorator form of profile_stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if get_profiler() is None:
+                return func(*args, **kwargs)
+            with profile_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,23 +1,93 @@
+import os
+import random
 import pandas as pd
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, IO, Union
+from pydantic import ValidationError
 from schemas.visitas_schema import VisitaRecord
 from datetime import datetime
 from expectations.visitas_expectations import validate_dataframe
+from modules.profiling import profiled, profile_stage
 
 logger = logging.getLogger(__name__)
 
+MAX_ERROR_SAMPLES = 5
+
+def error_code(e: Exception) -> tuple:
+    """Normalized (code, message) for a validation exception.
+
+    The code is `<field>.<pydantic error type>` for the first failing field.
+    The message may still contain the offending value (custom validators such
+    as `Invalid datetime format: {v}`); errors are grouped by code only, so the
+    first message seen is kept. Exceptions that are not a ValidationError (e.g.
+    a TypeError raised in a validator, which pydantic v2 does not wrap) carry
+    no field, so they get a `row.<exception type>` code.
+    """
+    if isinstance(e, ValidationError):
+        first = e.errors()[0]
+        field = '.'.join(str(part) for part in first['loc'])
+        return f"{field}.{first['type']}", f"{field}: {first['msg']}"
+    return f"row.{type(e).__name__}", str(e)
+
+def _compact_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop empty values and internal keys so error samples stay small"""
+    return {k: v for k, v in data.items() if k != 'linea' and v is not None and not pd.isna(v)}
+
+class ErrorAggregator:
+    """Group failing rows by error code.
+
+    Keeps a count, the lowest line and a reservoir sample of at most
+    `max_samples` rows per code, so memory is O(distinct errors) no matter
+    how many rows fail.
+    """
+
+    def __init__(self, max_samples: int = MAX_ERROR_SAMPLES):
+        self.max_samples = max_samples
+        self.groups = {}
+
+    def add(self, code: str, message: str, line: int, data: Dict[str, Any]):
+        group = self.groups.get(code)
+        if group is None:
+            group = self.groups[code] = {
+                'code': code, 'error': message, 'count': 0, 'first_line': line, 'samples': []
+            }
+        group['count'] += 1
+        # Rows can arrive out of file order (business rules run after dedup sorts by fecha_envio)
+        group['first_line'] = min(group['first_line'], line)
+        if len(group['samples']) < self.max_samples:
+            group['samples'].append({'line': line, 'data': _compact_row(data)})
+        else:
+            slot = random.randrange(group['count'])
+            if slot < self.max_samples:
+                group['samples'][slot] = {'line': line, 'data': _compact_row(data)}
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self.groups.values())
+
+    def __len__(self):
+        """Total failing rows"""
+        return sum(group['count'] for group in self.groups.values())
+
 class DataTransformer:
-    def __init__(self):
+    def __init__(self, max_error_samples: int = MAX_ERROR_SAMPLES):
+        self.max_error_samples = max_error_samples
         self.valid_records = []
-        self.error_records = []
-
-    def load_csv(self, filepath: str) -> pd.DataFrame:
-        """Load CSV file into DataFrame"""
-        df = pd.read_csv(filepath, sep=',', encoding='utf-8', header=0)
-        logger.info(f"Loaded {len(df)} rows from {filepath}")
+        self.errors = ErrorAggregator(max_error_samples)
+
+    @profiled('transformation.load_csv')
+    def load_csv(self, filepath: Union[str, IO]) -> pd.DataFrame:
+        """Load CSV file (path or open file, e.g. a zip member) into DataFrame.
+
+        Blank lines are read and then dropped, so the index keeps matching the
+        file: index + 2 is the source line (line 1 is the header). Quoted fields
+        spanning several lines would still shift it.
+        """
+        df = pd.read_csv(filepath, sep=',', encoding='utf-8', header=0, skip_blank_lines=False)
+        df = df.dropna(how='all')
+        logger.info(f"Loaded {len(df)} rows from {getattr(filepath, 'name', filepath)}")
         return df
 
+    @profiled('transformation.transform_dataframe')
     def transform_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """Apply transformations to DataFrame"""
         # Rename columns to match schema
@@ -45,6 +115,11 @@ class DataTransformer:
         # Normalize email to lowercase
         df['email'] = df['email'].str.lower()
 
+        # Empty cells come in as NaN; optional text fields must be None
+        string_fields = ['jk', 'badmail', 'baja', 'links', 'ips', 'navegadores', 'plataformas']
+        for field in [f for f in string_fields if f in df.columns]:
+            df[field] = df[field].astype(object).where(df[field].notna(), None)
+
         # Convert numeric fields
         numeric_fields = ['opens', 'opens_virales', 'clicks', 'clicks_virales']
         for field in numeric_fields:
@@ -57,16 +132,21 @@ class DataTransformer:
 
         return df
 
+    @profiled('transformation.validate_records')
     def validate_records(self, df: pd.DataFrame):
-        """Validate each record with Pydantic"""
+        """Validate each record with Pydantic, keeping its source line in `linea`"""
         for idx, row in df.iterrows():
+            line = idx + 2  # source line, see load_csv
             try:
-                record = VisitaRecord(**row.to_dict())
-                self.valid_records.append(record.dict())
+                record = VisitaRecord(**row.to_dict()).dict()
+                record['linea'] = line
+                self.valid_records.append(record)
             except Exception as e:
-                logger.error(f"Validation error for row {idx}: {e}")
-                self.error_records.append({'row': idx, 'data': row.to_dict(), 'error': str(e)})
+                code, message = error_code(e)
+                logger.debug(f"Validation error for line {line}: {message}")
+                self.errors.add(code, message, line, row.to_dict())
 
+    @profiled('transformation.deduplicate')
     def deduplicate(self):
         """Remove duplicates based on email and all fields, keep latest fecha_envio"""
         if not self.valid_records:
@@ -74,9 +154,10 @@ class DataTransformer:
 
         df = pd.DataFrame(self.valid_records)
         df = df.sort_values('fecha_envio', ascending=False)
-        df = df.drop_duplicates(subset=['email'] + [col for col in df.columns if col != 'email'], keep='first')
+        df = df.drop_duplicates(subset=['email'] + [col for col in df.columns if col not in ('email', 'linea')], keep='first')
         self.valid_records = df.to_dict('records')
 
+    @profiled('transformation.apply_business_rules')
     def apply_business_rules(self):
         """Apply business rules like temporal consistency"""
         if not self.valid_records:
@@ -88,34 +169,37 @@ class DataTransformer:
         invalid_open = df[(df['fecha_open'].notna()) & (df['fecha_open'] < df['fecha_envio'])]
         if not invalid_open.empty:
             logger.warning(f"Found {len(invalid_open)} records with invalid fecha_open")
-            for idx in invalid_open.index:
-                self.error_records.append({
-                    'row': idx,
-                    'data': df.loc[idx].to_dict(),
-                    'error': 'fecha_open < fecha_envio'
-                })
+            for row in invalid_open.to_dict('records'):
+                self.errors.add('fecha_open_before_envio', 'fecha_open < fecha_envio', row['linea'], row)
             df = df.drop(invalid_open.index)
 
         # Rule: fecha_click >= fecha_open and fecha_click <= fecha_envio (as per proposal)
         invalid_click = df[(df['fecha_click'].notna()) & ((df['fecha_click'] < df['fecha_open']) | (df['fecha_click'] > df['fecha_envio']))]
         if not invalid_click.empty:
             logger.warning(f"Found {len(invalid_click)} records with invalid fecha_click")
-            for idx in invalid_click.index:
-                self.error_records.append({
-                    'row': idx,
-                    'data': df.loc[idx].to_dict(),
-                    'error': 'fecha_click invalid'
-                })
+            for row in invalid_click.to_dict('records'):
+                self.errors.add('fecha_click_invalid', 'fecha_click invalid', row['linea'], row)
             df = df.drop(invalid_click.index)
 
         self.valid_records = df.to_dict('records')
 
-    def transform_file(self, filepath: str) -> Dict[str, List[Dict[str, Any]]]:
-        """Main transformation method"""
+    @profiled('transformation')
+    def transform_file(self, filepath: Union[str, IO], source: str = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Main transformation method.
+
+        Records are tagged with `origen`, the source report name (basename of
+        `filepath` unless given), which the loader uses for idempotent reloads.
+        `errors` holds one entry per error code (see ErrorAggregator), not one
+        per failing row.
+        """
+        source = source or os.path.basename(getattr(filepath, 'name', filepath))
+        self.valid_records = []
+        self.errors = ErrorAggregator(self.max_error_samples)
         df = self.load_csv(filepath)
 
         # Great Expectations validation
-        ge_results = validate_dataframe(df)
+        with profile_stage('transformation.ge_validation'):
+            ge_results = validate_dataframe(df)
         if not ge_results['success']:
             logger.warning(f"Great Expectations validation failed: {ge_results['statistics']}")
             # Log failed expectations
@@ -128,8 +212,17 @@ class DataTransformer:
         self.deduplicate()
         self.apply_business_rules()
 
+        for record in self.valid_records:
+            record.pop('linea', None)
+            record['origen'] = source
+        errors = self.errors.to_list()
+        for error in errors:
+            error['origen'] = source
+            logger.warning(f"{error['count']} rows failed with {error['code']} in {source} "
+                           f"(first at line {error['first_line']}): {error['error']}")
+
         return {
             'valid': self.valid_records,
-            'errors': self.error_records,
+            'errors': errors,
             'ge_results': ge_results
         }
\ No newline at end of file
@@ -47,10 +47,15 @@ class VisitaRecord(BaseModel):
 
     @validator('fecha_envio', 'fecha_open', 'fecha_click', pre=True)
     def parse_datetime(cls, v):
-        if v == '-' or v is None:
+        if v is None or v == '-' or v != v:  # v != v catches NaN/NaT
             return None
+        if isinstance(v, datetime):
+            # Already parsed by DataTransformer.transform_dataframe (pd.Timestamp)
+            return v.to_pydatetime() if hasattr(v, 'to_pydatetime') else v
+        # Only ValueError is wrapped by pydantic (with the field name); a
+        # TypeError from strptime on an unexpected type would escape it
         try:
-            return datetime.strptime(v, '%d/%m/%Y %H:%M')
+            return datetime.strptime(str(v), '%d/%m/%Y %H:%M')
         except ValueError:
             raise ValueError(f'Invalid datetime format: {v}')
 
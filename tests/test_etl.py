@@ -1,9 +1,13 @@
 import sys
 import os
+import subprocess
+import textwrap
+import pytest
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from modules.transformation import DataTransformer
 from modules.loading import MySQLLoader
+from modules.config import load_config
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -14,11 +18,323 @@ def test_transformation():
     result = transformer.transform_file('data/raw/report_7.txt')
 
     print(f"Valid records: {len(result['valid'])}")
-    print(f"Error records: {len(result['errors'])}")
+    print(f"Error records: {sum(error['count'] for error in result['errors'])}")
     print(f"GE validation success: {result['ge_results']['success']}")
 
     return result
 
+def test_config_is_cached():
+    """Repeated config loads reuse the parsed YAML"""
+    assert load_config() is load_config()
+
+HEAVY_MODULES = ['pandas', 'pydantic', 'great_expectations', 'mysql.connector']
+DAG_PARSE_BUDGET_SECONDS = float(os.environ.get('DAG_PARSE_BUDGET_SECONDS', '0.5'))
+
+def test_dag_parse_time_budget():
+    """DAG parsing must not import heavy dependencies nor exceed the time budget"""
+    pytest.importorskip('airflow')
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = textwrap.dedent(f"""
+        import importlib, sys, time
+        # Airflow itself is paid by the scheduler once, not per parse
+        import airflow, airflow.decorators, airflow.utils.dates
+        start = time.perf_counter()
+        importlib.import_module('dags.etl_visitas')
+        print(time.perf_counter() - start)
+        print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+    """)
+    out = subprocess.run([sys.executable, '-c', script], cwd=repo_root,
+                         capture_output=True, text=True, check=True).stdout.split('\n')
+    elapsed, heavy = float(out[0]), out[1]
+
+    assert heavy == '', f"DAG parse imported heavy modules: {heavy}"
+    assert elapsed < DAG_PARSE_BUDGET_SECONDS, f"DAG parse took {elapsed:.2f}s"
+
+def test_partition_routing():
+    """Records route to the first range partition whose bound exceeds fecha_envio"""
+    from datetime import datetime
+    from modules.loading import _to_days
+
+    assert _to_days(datetime(2013, 1, 1)) == 735234  # MySQL TO_DAYS('2013-01-01')
+    partitions = [
+        ('p_old', _to_days(datetime(2013, 1, 1))),
+        ('p201301', _to_days(datetime(2013, 2, 1))),
+        ('p201302', _to_days(datetime(2013, 3, 1))),
+        ('pmax', None),
+    ]
+    assert MySQLLoader.partition_for(datetime(2012, 12, 31, 23, 59), partitions) == 'p_old'
+    assert MySQLLoader.partition_for(datetime(2013, 1, 31, 23, 59), partitions) == 'p201301'
+    assert MySQLLoader.partition_for(datetime(2013, 2, 8, 18, 30), partitions) == 'p201302'
+    assert MySQLLoader.partition_for(datetime(2013, 3, 1), partitions) == 'pmax'
+    assert MySQLLoader.partition_for(datetime(2013, 3, 1), []) is None
+
+def test_stage_profiling(tmp_path):
+    """Nested profiled stages each write their own profile files"""
+    import pstats
+    from modules.profiling import configure_profiling, profiled
+
+    @profiled('inner')
+    def inner():
+        return sum(i * i for i in range(100000))
+
+    @profiled('outer')
+    def outer():
+        return inner()
+
+    try:
+        configure_profiling(mode='cprofile', output_dir=str(tmp_path), run_id='run', config={})
+        outer()
+        names = {f.name for f in (tmp_path / 'run').iterdir()}
+        assert {'outer.pstats', 'inner.pstats', 'outer.tracemalloc.txt', 'inner.tracemalloc.txt'} <= names
+        # The paused outer profile still accounts for the nested stage
+        outer_funcs = {func[2] for func in pstats.Stats(str(tmp_path / 'run' / 'outer.pstats')).stats}
+        assert 'inner' in outer_funcs
+
+        # tracemalloc_top: 0 keeps sampling low-overhead
+        configure_profiling(mode='sampling', output_dir=str(tmp_path), run_id='sampled',
+                            config={'profiling': {'tracemalloc_top': 0}})
+        outer()
+        assert {f.name for f in (tmp_path / 'sampled').iterdir()} == {'outer.collapsed', 'inner.collapsed'}
+
+        # Processes configured in the same second get their own directory
+        profiler = configure_profiling(mode='sampling', output_dir=str(tmp_path), config={})
+        assert profiler.output_dir.endswith(f'-{os.getpid()}')
+    finally:
+        configure_profiling(mode='', config={})
+
+def test_backfill_finds_archives_in_range(tmp_path):
+    """Only visitas_backup_YYYYMMDD.zip archives inside the range are replayed"""
+    from datetime import date
+    from modules.backfill import find_archives
+
+    for name in ['visitas_backup_20240101.zip', 'visitas_backup_20240215.zip',
+                 'visitas_backup_20240301.zip', 'otro_20240201.zip']:
+        (tmp_path / name).touch()
+
+    archives = find_archives(str(tmp_path), date(2024, 1, 1), date(2024, 2, 29))
+    assert [d for d, _ in archives] == [date(2024, 1, 1), date(2024, 2, 15)]
+
+def test_transform_zip_member(tmp_path):
+    """Reports are transformed straight from a backup archive and tagged with their source"""
+    import zipfile
+
+    zip_path = tmp_path / 'visitas_backup_20240101.zip'
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.write('data/raw/report_7.txt', 'report_7.txt')
+
+    with zipfile.ZipFile(zip_path) as zipf, zipf.open('report_7.txt') as f:
+        result = DataTransformer().transform_file(f)
+
+    assert result['valid']
+    assert {record['origen'] for record in result['valid']} == {'report_7.txt'}
+
+def test_errors_are_aggregated():
+    """Repeated failures collapse into one entry per code with capped samples"""
+    from modules.transformation import ErrorAggregator
+
+    errors = ErrorAggregator(max_samples=3)
+    for line in range(2, 1002):
+        errors.add('ips.value_error', 'ips: Invalid IP format', line, {'email': 'a@b.com', 'ips': 'x', 'links': None})
+    errors.add('fecha_click_invalid', 'fecha_click invalid', 5000, {'email': 'c@d.com'})
+    # Lines added out of order (business rules run after dedup sorts by fecha_envio)
+    for line in (7, 3, 5):
+        errors.add('fecha_open_before_envio', 'fecha_open < fecha_envio', line, {'email': 'e@f.com'})
+
+    groups = {group['code']: group for group in errors.to_list()}
+    assert len(errors) == 1004
+    assert groups['fecha_open_before_envio']['first_line'] == 3
+    assert groups['ips.value_error']['count'] == 1000
+    assert groups['ips.value_error']['first_line'] == 2
+    assert len(groups['ips.value_error']['samples']) == 3
+    assert 'links' not in groups['ips.value_error']['samples'][0]['data']
+    assert groups['fecha_click_invalid']['samples'] == [{'line': 5000, 'data': {'email': 'c@d.com'}}]
+
+def test_daily_rollup_aggregation():
+    """Batches are pre-aggregated per send date, platform and browser"""
+    from datetime import datetime, date
+    from modules.loading import aggregate_daily
+
+    base = {'opens_virales': 0, 'clicks_virales': 0, 'badmail': None, 'baja': None, 'navegadores': None}
+    records = [
+        dict(base, email='a@x.com', fecha_envio=datetime(2013, 2, 8, 18, 30), plataformas='Windows', opens=2, clicks=1),
+        dict(base, email='b@x.com', fecha_envio=datetime(2013, 2, 8, 9, 0), plataformas='Windows', opens=0, clicks=0,
+             badmail='HARD'),
+        dict(base, email='c@x.com', fecha_envio=datetime(2013, 2, 9, 9, 0), plataformas=None, opens=1, clicks=0,
+             baja='SI'),
+    ]
+
+    rows = {row[:3]: row[3:] for row in aggregate_daily(records)}
+    # envios, opens, opens_virales, clicks, clicks_virales, con_open, con_click, badmails, bajas
+    assert rows[(date(2013, 2, 8), 'Windows', '')] == (2, 2, 0, 1, 0, 1, 1, 1, 0)
+    assert rows[(date(2013, 2, 9), '', '')] == (1, 1, 0, 0, 0, 1, 0, 0, 1)
+    # Sorted by key whatever the record order, for a consistent lock order
+    assert [row[:3] for row in aggregate_daily(records[::-1])] == sorted(rows)
+    assert aggregate_daily([]) == []
+
+class FakeCursor:
+    """Minimal DB-API cursor recording statements; fails on statements containing `fail_on`"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        if self.connection.fail_on and self.connection.fail_on in query:
+            raise RuntimeError(f"failed on {self.connection.fail_on}")
+        self.connection.statements.append(' '.join(query.split()))
+
+    def executemany(self, query, rows):
+        self.execute(query)
+
+    def fetchone(self):
+        return self.connection.fetchone_result
+
+    def fetchall(self):
+        return [(None, None)]  # unpartitioned table; no migrations applied
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, fail_on=None, fetchone_result=None):
+        self.fail_on = fail_on
+        self.fetchone_result = fetchone_result
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+def test_load_source_is_one_transaction():
+    """Deleting old rows, inserting and recording in cargas commit together or not at all"""
+    from datetime import datetime
+
+    record = {'email': 'a@x.com', 'fecha_envio': datetime(2013, 2, 8, 18, 30), 'opens': 1, 'opens_virales': 0,
+              'clicks': 0, 'clicks_virales': 0, 'origen': 'report_7.txt'}
+    error = {'code': 'ips.value_error', 'error': 'ips: Invalid IP format', 'count': 2, 'first_line': 9,
+             'samples': [], 'origen': 'report_7.txt'}
+
+    loader = MySQLLoader('h', 'u', 'p', 'db')
+    loader.connection = FakeConnection()
+    loader.load_source('report_7.txt', 'abc', [record], [error])
+    assert loader.connection.commits == 1
+    # A new source has nothing to delete (and the empty DELETE would still take gap locks)
+    assert not any(statement.startswith('DELETE') for statement in loader.connection.statements)
+    assert any('ON DUPLICATE KEY UPDATE fechaPrimeraVisita = LEAST' in statement
+               for statement in loader.connection.statements if statement.startswith('INSERT INTO visitante'))
+
+    loader.connection = FakeConnection()
+    loader.load_source('report_7.txt', 'abc', [record], [error], replace=True)
+    assert loader.connection.commits == 1
+    assert any(statement.startswith('DELETE FROM estadistica WHERE origen') for statement in loader.connection.statements)
+    assert not any(statement.startswith('INSERT INTO visitante') for statement in loader.connection.statements)
+    # Emptied rollup groups are removed by key, not with a scan of the whole table
+    rollup_deletes = [statement for statement in loader.connection.statements
+                      if statement.startswith('DELETE FROM estadistica_diaria')]
+    assert rollup_deletes and all('fecha = %s' in statement for statement in rollup_deletes)
+
+    loader.connection = FakeConnection(fail_on='INSERT INTO cargas')
+    with pytest.raises(RuntimeError):
+        loader.load_source('report_7.txt', 'abc', [record], [error])
+    assert (loader.connection.commits, loader.connection.rollbacks) == (0, 1)
+
+def test_backfill_retries_deadlocks():
+    """Deadlocked loads are retried; other errors are raised at once"""
+    from modules.backfill import load_with_retry
+
+    class LockError(Exception):
+        def __init__(self, errno):
+            super().__init__(f"MySQL error {errno}")
+            self.errno = errno
+
+    class FlakyLoader:
+        def __init__(self, *errors):
+            self.errors = list(errors)
+            self.calls = 0
+
+        def load_source(self, source, *args, **kwargs):
+            self.calls += 1
+            if self.errors:
+                raise self.errors.pop(0)
+
+    loader = FlakyLoader(LockError(1213), LockError(1205))
+    load_with_retry(loader, 'report_7.txt', 'abc', [], [], delay=0)
+    assert loader.calls == 3
+
+    loader = FlakyLoader(LockError(1062))
+    with pytest.raises(LockError):
+        load_with_retry(loader, 'report_7.txt', 'abc', [], [], delay=0)
+    assert loader.calls == 1
+
+def test_monthly_partition_clauses():
+    """Migration and loader share the same monthly partition naming"""
+    from datetime import date
+    from modules.loading import monthly_partitions
+
+    assert monthly_partitions(date(2012, 12, 15), date(2013, 2, 1)) == [
+        "PARTITION p201212 VALUES LESS THAN (TO_DAYS('2013-01-01'))",
+        "PARTITION p201301 VALUES LESS THAN (TO_DAYS('2013-02-01'))",
+    ]
+
+def test_partitions_capped_ahead():
+    """A far-future fecha_envio stays in pmax instead of adding a partition per month"""
+    from datetime import datetime, date
+    from modules.loading import _to_days
+
+    this_month = date.today().replace(day=1)
+    loader = MySQLLoader('h', 'u', 'p', 'db', partition_months_ahead=2)
+    loader.connection = FakeConnection()
+    loader.get_partitions = lambda table='estadistica': [('p_old', _to_days(this_month)), ('pmax', None)]
+    loader.ensure_partitions([datetime(9999, 12, 31)])
+
+    reorganize = next(statement for statement in loader.connection.statements if 'REORGANIZE' in statement)
+    assert reorganize.count('VALUES LESS THAN (') == 3
+    assert reorganize.endswith("PARTITION pmax VALUES LESS THAN MAXVALUE)")
+
+def test_migrate_existing_database():
+    """Migrations bring an existing database to the init.sql schema"""
+    from datetime import datetime
+    from modules.migrations import migrate
+
+    loader = MySQLLoader('h', 'u', 'p', 'db', partition_months_ahead=0)
+    loader.connection = FakeConnection(fetchone_result=(datetime(2013, 2, 8),))
+    applied = migrate(loader)
+    assert applied[0] == '001_particiones_estadistica'
+    assert '002_origen_cargas' in applied
+    assert '003_errores_agregados' in applied
+    assert applied[-1] == '004_estadistica_diaria'
+
+    statements = loader.connection.statements
+    assert any(statement.startswith('INSERT INTO estadistica_diaria') and 'FROM estadistica' in statement
+               for statement in statements)
+    partition_by = next(statement for statement in statements if 'PARTITION BY RANGE' in statement)
+    assert "PARTITION p_old VALUES LESS THAN (TO_DAYS('2013-02-01'))" in partition_by
+    assert "PARTITION p201303 VALUES LESS THAN (TO_DAYS('2013-04-01'))" in partition_by
+    assert partition_by.endswith("PARTITION pmax VALUES LESS THAN MAXVALUE)")
+    assert any('ADD PRIMARY KEY (id, fecha_envio)' in statement for statement in statements)
+
+def test_error_codes_and_lines_per_field(tmp_path):
+    """Validation errors are coded per field and point at the real file line"""
+    with open('data/raw/report_7.txt') as f:
+        header, *rows = f.read().splitlines()
+    bad_date = rows[0].replace('08/02/2013 18:30', '2013-02-08', 1)
+    report = tmp_path / 'report_blank.txt'
+    report.write_text('\n'.join([header, rows[0], '', bad_date, rows[1]]) + '\n')
+
+    result = DataTransformer().transform_file(str(report))
+
+    assert len(result['errors']) == 1
+    assert result['errors'][0]['code'].startswith('fecha_envio.')
+    assert result['errors'][0]['first_line'] == 4
+    assert len(result['valid']) == 2
+
 def test_loading():
     """Test loading module (requires MySQL)"""
     # This would require a test database